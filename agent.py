@@ -5,29 +5,54 @@ Automated investor qualification agent using LiveKit Agents v1.3.x.
 Handles both inbound and outbound calls to qualify CRE investors.
 """
 
-from dotenv import load_dotenv
+import asyncio
+import base64
+import gzip
 import hashlib
-import hmac as hmac_module
-import httpx
-import json
+import hmac
+import logging
 import os
+import threading
+from functools import lru_cache
+from string import Template
+from types import MappingProxyType
+
+import httpx
+import orjson
+from dotenv import load_dotenv
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
 
 from livekit import agents, api, rtc
 from livekit.agents import AgentServer, AgentSession, Agent, room_io, get_job_context, RunContext
 from livekit.agents.llm import function_tool
-from livekit.plugins import noise_cancellation, openai
-from livekit.plugins.turn_detector.multilingual import MultilingualModel
-
-from livekit.plugins import ultravox
+from livekit.plugins import noise_cancellation, ultravox
 
 load_dotenv(".env.local")
 
+logger = logging.getLogger("blackkeyx")
+
+# libuv event loop: fewer syscalls per audio frame / websocket message. Set at import so
+# job processes, which re-import this module before starting their loop, pick it up too.
+if uvloop is not None:
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
 BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000")
 AGENT_CALLBACK_SECRET = os.getenv("AGENT_CALLBACK_SECRET", "changeme-agent-secret")
 VOICEMAIL_LEAVE_MESSAGE = os.getenv("VOICEMAIL_LEAVE_MESSAGE", "false").lower() == "true"
+# Send base64 signatures in X-Agent-Signature-V2 (backend must accept the V2 header)
+AGENT_SIGNATURE_V2 = os.getenv("AGENT_SIGNATURE_V2", "false").lower() == "true"
+# Gzip the session-complete body (backend must accept Content-Encoding: gzip)
+TRANSCRIPT_GZIP = os.getenv("TRANSCRIPT_GZIP", "false").lower() == "true"
+
+# HMAC key derived from AGENT_CALLBACK_SECRET, computed once instead of per request
+_SIGNING_KEY = hashlib.sha256(AGENT_CALLBACK_SECRET.encode()).digest()
 
-# Module-level dict to store callback requests by room name
-_callback_requests: dict[str, dict] = {}
+# Per-thread backend client; see get_http_client
+_http_local = threading.local()
 
 # Module-level dict to store voicemail detection results by room name
 _voicemail_results: dict[str, dict] = {}
@@ -70,70 +95,102 @@ class VoicemailDetector:
         return False, 0.0
 
 
-def sign_payload(body: bytes, secret: str) -> str:
-    """Create HMAC-SHA256 signature for agent callback requests."""
-    key = hashlib.sha256(secret.encode()).digest()
-    return hmac_module.new(key, body, hashlib.sha256).hexdigest()
-
-
-class BlackKeyXAdvisor(Agent):
-    """BlackKeyX AI Investment Advisor for investor qualification."""
-
-    @staticmethod
-    def _format_capital_for_voice(capital) -> str:
-        """Format capital value into natural speech for TTS."""
-        if not capital:
-            return ""
-
-        # String formats from chatbot (e.g. "$1M+" → "over 1 million dollars")
-        voice_map = {
-            "$100K-$250K": "100 to 250 thousand dollars",
-            "$250K-$500K": "250 to 500 thousand dollars",
-            "$500K-$1M": "500 thousand to 1 million dollars",
-            "$1M+": "over 1 million dollars",
-        }
+def _hmac_sha256(body: bytes, secret: str) -> bytes:
+    """Raw HMAC-SHA256 of body, keyed with the SHA-256 of the secret."""
+    if secret == AGENT_CALLBACK_SECRET:
+        key = _SIGNING_KEY
+    else:
+        key = hashlib.sha256(secret.encode()).digest()
+    return hmac.digest(key, body, "sha256")
 
-        if isinstance(capital, str):
-            if capital in voice_map:
-                return voice_map[capital]
-            if capital.startswith("other:"):
-                return ""
-            return capital
 
-        # Integer values from DB (e.g. 1500000 → "1.5 million dollars")
-        if isinstance(capital, (int, float)):
-            if capital >= 1_000_000:
-                millions = capital / 1_000_000
-                if millions == int(millions):
-                    return f"{int(millions)} million dollars"
-                return f"{millions:.1f} million dollars"
-            if capital >= 1_000:
-                thousands = capital / 1_000
-                if thousands == int(thousands):
-                    return f"{int(thousands)} thousand dollars"
-                return f"{thousands:.0f} thousand dollars"
-            return f"{capital} dollars"
+def sign_payload(body: bytes, secret: str) -> str:
+    """Create HMAC-SHA256 signature for agent callback requests (hex, X-Agent-Signature)."""
+    return _hmac_sha256(body, secret).hex()
 
-        return str(capital)
 
-    def __init__(self, investor_context: dict | None = None) -> None:
-        self.investor_context = investor_context or {}
+def sign_payload_v2(body: bytes, secret: str) -> str:
+    """Create HMAC-SHA256 signature for agent callback requests (base64, X-Agent-Signature-V2)."""
+    return base64.b64encode(_hmac_sha256(body, secret)).decode("ascii")
 
-        # Extract context fields
-        is_outbound = self.investor_context.get("outbound", False)
-        name = self.investor_context.get("name", "")
-        capital = self._format_capital_for_voice(self.investor_context.get("capital_available"))
-        timeline = self.investor_context.get("timeline", "")
 
-        # --- Persona (shared) ---
-        persona = """You are Alex, an AI Investment Advisor at Black Key Exchange. Your persona combines:
+def signed_json_headers(body: bytes) -> dict[str, str]:
+    """Headers for a signed JSON request to the backend."""
+    if AGENT_SIGNATURE_V2:
+        return {
+            "Content-Type": "application/json",
+            "X-Agent-Signature-V2": sign_payload_v2(body, AGENT_CALLBACK_SECRET),
+        }
+    return {
+        "Content-Type": "application/json",
+        "X-Agent-Signature": sign_payload(body, AGENT_CALLBACK_SECRET),
+    }
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the backend HTTP client, keeping connections warm across requests.
+
+    The connection pool is bound to the event loop that created it, so each
+    thread keeps its own client and replaces it when a job runs on a new loop
+    (thread executor). The replaced client is abandoned on purpose rather than
+    closed: its loop has already finished, so aclose() cannot run on it.
+    """
+    loop = asyncio.get_running_loop()
+    client = getattr(_http_local, "client", None)
+    if client is None or client.is_closed or _http_local.loop is not loop:
+        client = httpx.AsyncClient(
+            base_url=BACKEND_URL,
+            timeout=10.0,
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=32, keepalive_expiry=60),
+        )
+        _http_local.client = client
+        _http_local.loop = loop
+    return client
+
+
+def build_transcript(items: list) -> str:
+    """Extract text transcript from chat history items."""
+    lines: list[str] = []
+    append = lines.append
+    for item in items:
+        if item.get("type") != "message":
+            continue
+        # List comprehension, not a generator: str.join materializes its input anyway
+        text = " ".join([c for c in item.get("content") or () if type(c) is str])
+        if text:
+            append(f"{item.get('role', 'unknown')}: {text}")
+    return "\n".join(lines)
+
+
+def should_save_session(
+    items: list, callback_requested: bool, is_outbound: bool, had_phone_caller: bool
+) -> bool:
+    """Whether session-complete carries anything the backend uses.
+
+    Outbound calls always record their outcome, and phone callers are reported
+    even when they hang up before speaking so they still become leads.
+    """
+    return bool(items) or callback_requested or is_outbound or had_phone_caller
+
+
+# Chatbot capital ranges → natural speech for TTS
+_CAPITAL_VOICE_MAP = MappingProxyType({
+    "$100K-$250K": "100 to 250 thousand dollars",
+    "$250K-$500K": "250 to 500 thousand dollars",
+    "$500K-$1M": "500 thousand to 1 million dollars",
+    "$1M+": "over 1 million dollars",
+})
+
+# --- Instruction blocks shared by every call, built once at import ---
+
+_PERSONA = """You are Alex, an AI Investment Advisor at Black Key Exchange. Your persona combines:
 - Financial sophistication of a top-tier investment banker
 - Conversational warmth of a trusted financial advisor
 - Selective, informed, and slightly hard-to-access — never promotional or mass-market
 - You speak to peers who already deploy capital; you are not selling, you are qualifying fit"""
 
-        # --- Company positioning (shared) ---
-        positioning = """ABOUT BLACK KEY EXCHANGE (use this framing consistently):
+_POSITIONING = """ABOUT BLACK KEY EXCHANGE (use this framing consistently):
 - Black Key Exchange is a private network of up to 200 accredited investors, each allocating $500,000+ annually into institutional-quality commercial real estate.
 - At scale, the network represents $100M+ of coordinated annual capital — enough to influence terms, improve alignment with sponsors, and access opportunities typically reserved for institutional capital.
 - Two things set it apart:
@@ -146,100 +203,7 @@ HOW TO TALK ABOUT IT:
 - It is NOT a fund, NOT a marketplace, NOT a blind pool, and NOT a syndication. Investors always retain control over their own capital and diligence.
 - If asked "what is it," lead with: a private network of accredited investors using shared AI underwriting tools and optional coordination to access better terms in a reset market."""
 
-        # --- Prior knowledge (conditional — never say "Unknown") ---
-        prior_lines = []
-        if capital:
-            prior_lines.append(f"- Capital available: {capital}")
-        if timeline:
-            prior_lines.append(f"- Investment timeline: {timeline}")
-
-        if prior_lines:
-            prior_knowledge = (
-                "What you already know from the chatbot:\n"
-                + "\n".join(prior_lines)
-                + "\nWhen the investor asks what you know about them, openly share this information."
-            )
-        else:
-            prior_knowledge = (
-                "No prior information is available about this investor's capital or timeline. "
-                "You will need to learn these details during the conversation."
-            )
-
-        # --- Call flow (branched on inbound vs outbound) ---
-        if is_outbound:
-            investor_name = name or "the investor"
-            call_flow = f"""CALL TYPE: OUTBOUND
-You are calling {investor_name} who expressed interest in CRE investments through our platform.
-
-YOUR VERY FIRST MESSAGE MUST follow this exact format:
-"This is Alex calling from Black Key Exchange. Am I speaking with {investor_name}?"
-- Start directly with your introduction. Do NOT say "Hi" or "Hello" or any greeting before introducing yourself.
-- You MUST introduce yourself as Alex from Black Key Exchange BEFORE asking who you are speaking with.
-- Do NOT greet them by name before introducing yourself — you do not know who picked up.
-- Do NOT ask about timing yet — wait for identity confirmation first.
-
-AFTER THEY RESPOND TO YOUR INTRODUCTION:
-- If they CONFIRM they are {investor_name}: Ask "Is this a good time to talk?" or similar. Wait for their answer before starting qualification.
-- If they say it is the WRONG PERSON: You MUST apologize sincerely first. Say something like "I'm so sorry for the inconvenience" or "I apologize for the mix-up." Then ask if they can connect you with {investor_name} or if there is a better number to reach them. If not possible, thank them and end the call gracefully. Do NOT proceed with qualification questions.
-- If they CONFIRM but say it is a BAD TIME: Follow the CALLBACK REQUESTS rule (Rule 9) — acknowledge, ask for a preferred time, confirm timezone, and use the request_callback tool.
-- If they seem hesitant: Briefly mention they expressed interest through your platform. Do not be pushy."""
-        else:
-            qualification_bucket = self.investor_context.get("qualification_bucket", "")
-            is_returning = bool(name and name not in ("", "Inbound Caller"))
-
-            if is_returning:
-                known_prefs = []
-                if capital:
-                    known_prefs.append(f"capital: {capital}")
-                if timeline:
-                    known_prefs.append(f"timeline: {timeline}")
-                if self.investor_context.get("investment_preferences"):
-                    known_prefs.append(f"interests: {', '.join(self.investor_context['investment_preferences'])}")
-                if self.investor_context.get("risk_tolerance"):
-                    known_prefs.append(f"risk tolerance: {self.investor_context['risk_tolerance']}")
-                prefs_summary = f" Known preferences — {'; '.join(known_prefs)}." if known_prefs else ""
-                caller_ref = (
-                    f"You're speaking with a returning investor named {name}.{prefs_summary} "
-                    f"Greet them by name. You already know who they are — do NOT ask for their name again."
-                )
-                if qualification_bucket in ("highly_qualified", "qualified"):
-                    caller_ref += f" They are already marked as {qualification_bucket.replace('_', ' ')}. Focus on next steps rather than re-qualifying from scratch."
-            else:
-                caller_ref = "The caller is a new inbound lead interested in CRE investments."
-
-            name_rule = (
-                "- You already know this caller's name — do NOT ask for it again."
-                if is_returning else
-                "- Early in the conversation, ask for the caller's name naturally (e.g. \"May I ask your name?\"). As soon as they tell you their name, call the save_caller_name tool immediately, then go straight into qualification questions. Do NOT ask generic questions like 'What brings you here?' or 'How can I help you?'."
-            )
-
-            call_flow = f"""CALL TYPE: INBOUND
-{caller_ref}
-
-{"YOUR VERY FIRST MESSAGE MUST: Introduce yourself as Alex from Black Key Exchange, then ask for the caller's name (e.g. 'Welcome to Black Key Exchange, this is Alex. May I know who I have the pleasure of speaking with today?'). Do NOT proceed with any qualification questions until you have their name. As soon as they tell you their name, call the save_caller_name tool immediately, then jump straight into the first qualification question (e.g. preferred geographic markets or property types). Do NOT ask 'What brings you here?' or 'How can I help you?' or any generic open-ended question — go directly into qualification." if not is_returning else "Greet the caller warmly by name and introduce yourself as Alex from Black Key Exchange."}
-
-IMPORTANT RULES FOR INBOUND CALLS:
-- Do NOT attempt to confirm the caller's identity. Do NOT ask "Am I speaking with...?" or "Is this [name]?" — they called you, so there is no need to verify who they are.
-{name_rule}
-- Listen actively and show genuine empathy about any experiences they share.
-- If they mention a bad experience, acknowledge it with genuine empathy and ask a follow-up about it or naturally transition to understanding their risk tolerance or markets to avoid. Do NOT change the subject to identity confirmation or anything unrelated to what they just shared.
-- Do NOT offer to evaluate specific deals or properties. You are a qualifier, not a financial advisor. If asked about a specific deal, explain that a team member can help with specific opportunities."""
-
-        # --- Qualification goals (shared) ---
-        qualification_goals = """Your goal: Qualify this investor through natural conversation. You need to understand:
-1. Preferred geographic markets (which cities/regions they're interested in)
-2. Property types of interest (industrial, multifamily, office, retail, self-storage)
-3. Investment strategy preference (core/stabilized, value-add, opportunistic)
-4. Risk tolerance (conservative, moderate, aggressive)
-5. Target hold period (short-term flip, 3-5 years, long-term hold)
-6. Past CRE investment experience (first-time investor, some experience, seasoned)
-7. Return expectations — target IRR range (e.g., "8-12%", "15%+", "double digits")
-8. Deal structure preferences — LP, JV, co-GP, REIT, DST, fund, syndication
-9. Markets to avoid — explicitly ask if there are regions they want to exclude
-10. Investment timeline — when they're looking to deploy capital"""
-
-        # --- Critical rules (top-level, high priority) ---
-        critical_rules = """CRITICAL RULES YOU MUST ALWAYS FOLLOW:
+_CRITICAL_RULES = """CRITICAL RULES YOU MUST ALWAYS FOLLOW:
 
 1. HONESTY ABOUT AI IDENTITY: You are an AI assistant — not a human. This rule ONLY fires when the caller specifically asks about your human-vs-AI nature — phrasings like "are you a real person?", "are you human?", "am I talking to a real person?", "are you a bot?", "is this AI?", "are you automated?", "am I being recorded?", or direct variants. When that happens, you MUST honestly disclose that you are an AI assistant. NEVER claim or imply you are human. NEVER deflect, joke, change the subject, or give a vague non-answer. Always include your name when disclosing — for example: "This is Alex — I'm actually an AI assistant with Black Key Exchange. I handle the initial conversation and pass qualified interest to the team. Happy to keep going if that works for you." After disclosing, continue the conversation naturally if they wish. THIS RULE OVERRIDES EVERY OTHER PERSONA OR STYLE RULE when it fires. IMPORTANT: This rule does NOT fire on generic identity questions like "Who am I talking to?", "What's your name?", or "Who is this?" — for those, simply answer "This is Alex from Black Key Exchange" as normal without volunteering AI nature unprompted.
 
@@ -271,8 +235,19 @@ IMPORTANT RULES FOR INBOUND CALLS:
     - "Collective negotiating leverage," NOT "pooled buying power"
     The feel should be empowering and peer-driven, not centralized or promotional."""
 
-        # --- Conversation guidelines (shared) ---
-        guidelines = """Conversation guidelines:
+_QUALIFICATION_GOALS = """Your goal: Qualify this investor through natural conversation. You need to understand:
+1. Preferred geographic markets (which cities/regions they're interested in)
+2. Property types of interest (industrial, multifamily, office, retail, self-storage)
+3. Investment strategy preference (core/stabilized, value-add, opportunistic)
+4. Risk tolerance (conservative, moderate, aggressive)
+5. Target hold period (short-term flip, 3-5 years, long-term hold)
+6. Past CRE investment experience (first-time investor, some experience, seasoned)
+7. Return expectations — target IRR range (e.g., "8-12%", "15%+", "double digits")
+8. Deal structure preferences — LP, JV, co-GP, REIT, DST, fund, syndication
+9. Markets to avoid — explicitly ask if there are regions they want to exclude
+10. Investment timeline — when they're looking to deploy capital"""
+
+_GUIDELINES = """Conversation guidelines:
 - Listen actively and ask follow-up questions on interesting points
 - Show genuine interest in their investment goals
 - Aim for a 5-7 minute natural conversation
@@ -282,31 +257,250 @@ IMPORTANT RULES FOR INBOUND CALLS:
 Remember: You are having a phone conversation, so be natural and avoid overly formal language.
 Do not use bullet points or lists in your responses — speak conversationally."""
 
-        instructions = "\n\n".join([
-            persona,
-            positioning,
-            critical_rules,
-            call_flow,
-            prior_knowledge,
-            qualification_goals,
-            guidelines,
-        ])
+# Identical bytes on every call so the provider can cache the prompt prefix;
+# everything call-specific is appended after it
+_STATIC_PREFIX = "\n\n".join([
+    _PERSONA,
+    _POSITIONING,
+    _CRITICAL_RULES,
+    _QUALIFICATION_GOALS,
+    _GUIDELINES,
+])
+
+# --- Call-specific instruction templates ---
+
+_OUTBOUND_CALL_FLOW = Template("""CALL TYPE: OUTBOUND
+You are calling $investor_name who expressed interest in CRE investments through our platform.
+
+YOUR VERY FIRST MESSAGE MUST follow this exact format:
+"This is Alex calling from Black Key Exchange. Am I speaking with $investor_name?"
+- Start directly with your introduction. Do NOT say "Hi" or "Hello" or any greeting before introducing yourself.
+- You MUST introduce yourself as Alex from Black Key Exchange BEFORE asking who you are speaking with.
+- Do NOT greet them by name before introducing yourself — you do not know who picked up.
+- Do NOT ask about timing yet — wait for identity confirmation first.
+
+AFTER THEY RESPOND TO YOUR INTRODUCTION:
+- If they CONFIRM they are $investor_name: Ask "Is this a good time to talk?" or similar. Wait for their answer before starting qualification.
+- If they say it is the WRONG PERSON: You MUST apologize sincerely first. Say something like "I'm so sorry for the inconvenience" or "I apologize for the mix-up." Then ask if they can connect you with $investor_name or if there is a better number to reach them. If not possible, thank them and end the call gracefully. Do NOT proceed with qualification questions.
+- If they CONFIRM but say it is a BAD TIME: Follow the CALLBACK REQUESTS rule (Rule 9) — acknowledge, ask for a preferred time, confirm timezone, and use the request_callback tool.
+- If they seem hesitant: Briefly mention they expressed interest through your platform. Do not be pushy.""")
+
+_INBOUND_CALL_FLOW = Template("""CALL TYPE: INBOUND
+$caller_ref
+
+$first_message
+
+IMPORTANT RULES FOR INBOUND CALLS:
+- Do NOT attempt to confirm the caller's identity. Do NOT ask "Am I speaking with...?" or "Is this [name]?" — they called you, so there is no need to verify who they are.
+$name_rule
+- Listen actively and show genuine empathy about any experiences they share.
+- If they mention a bad experience, acknowledge it with genuine empathy and ask a follow-up about it or naturally transition to understanding their risk tolerance or markets to avoid. Do NOT change the subject to identity confirmation or anything unrelated to what they just shared.
+- Do NOT offer to evaluate specific deals or properties. You are a qualifier, not a financial advisor. If asked about a specific deal, explain that a team member can help with specific opportunities.""")
+
+_NEW_CALLER_REF = "The caller is a new inbound lead interested in CRE investments."
+
+_NEW_CALLER_FIRST_MESSAGE = "YOUR VERY FIRST MESSAGE MUST: Introduce yourself as Alex from Black Key Exchange, then ask for the caller's name (e.g. 'Welcome to Black Key Exchange, this is Alex. May I know who I have the pleasure of speaking with today?'). Do NOT proceed with any qualification questions until you have their name. As soon as they tell you their name, call the save_caller_name tool immediately, then jump straight into the first qualification question (e.g. preferred geographic markets or property types). Do NOT ask 'What brings you here?' or 'How can I help you?' or any generic open-ended question — go directly into qualification."
+
+_RETURNING_CALLER_FIRST_MESSAGE = "Greet the caller warmly by name and introduce yourself as Alex from Black Key Exchange."
+
+_NEW_CALLER_NAME_RULE = "- Early in the conversation, ask for the caller's name naturally (e.g. \"May I ask your name?\"). As soon as they tell you their name, call the save_caller_name tool immediately, then go straight into qualification questions. Do NOT ask generic questions like 'What brings you here?' or 'How can I help you?'."
+
+_RETURNING_CALLER_NAME_RULE = "- You already know this caller's name — do NOT ask for it again."
+
+_PRIOR_KNOWLEDGE = Template(
+    "What you already know from the chatbot:\n"
+    "$prior_lines"
+    "\nWhen the investor asks what you know about them, openly share this information."
+)
+
+_NO_PRIOR_KNOWLEDGE = (
+    "No prior information is available about this investor's capital or timeline. "
+    "You will need to learn these details during the conversation."
+)
+
+
+# --- generate_reply instructions ---
+
+_OUTBOUND_GREETING = Template("""Say "Hi, this is Alex calling from Black Key Exchange. Am I speaking with $investor_name?"
+Do NOT greet them by name before introducing yourself — you don't know who picked up yet.
+Wait for their confirmation before asking anything else.
+Do NOT ask about timing yet - wait for them to confirm they are $investor_name first.""")
+
+_RETURNING_GREETING = Template("Greet $investor_name warmly by name. Introduce yourself as Alex from Black Key Exchange. Welcome them back and ask how you can help them today.")
+
+_NEW_CALLER_GREETING = """You MUST say something like: "Welcome to Black Key Exchange! This is Alex. May I know who I have the pleasure of speaking with today?"
+You MUST ask for the caller's name in this first message. Do NOT ask about their investment goals or how you can help yet — just introduce yourself and ask their name. Nothing else."""
+
+_END_CALL_INSTRUCTIONS = "Thank the investor warmly for their time. Summarize the key preferences you learned (markets, property types, strategy). Let them know a Black Key Exchange team member will follow up within 24 hours with curated opportunities aligned with their mandate."
+
+_VOICEMAIL_MESSAGE_INSTRUCTIONS = "You've reached a voicemail. Leave a brief professional message: 'Hi, this is Alex from Black Key Exchange. We're assembling a private network of accredited investors around a narrow window in the current real estate cycle, and your profile stood out. When you have a moment, please give us a call back. Thank you.'"
+
+_CALLBACK_CONFIRMATION = Template("""Confirm the callback time with the investor.
+They requested: $callback_datetime.
+Thank them warmly for their time and let them know the Black Key Exchange team will
+reach out at their preferred time. Keep it brief and friendly.""")
+
+
+@lru_cache(maxsize=128)
+def _render_instructions(
+    is_outbound: bool,
+    name: str,
+    capital: str,
+    timeline: str,
+    qualification_bucket: str,
+    investment_preferences: tuple[str, ...] | str,
+    risk_tolerance: str,
+) -> str:
+    """Render the full agent instructions; cached so repeated contexts reuse the same string."""
+    # --- Prior knowledge (conditional — never say "Unknown") ---
+    prior_lines = []
+    if capital:
+        prior_lines.append(f"- Capital available: {capital}")
+    if timeline:
+        prior_lines.append(f"- Investment timeline: {timeline}")
+
+    if prior_lines:
+        prior_knowledge = _PRIOR_KNOWLEDGE.substitute(prior_lines="\n".join(prior_lines))
+    else:
+        prior_knowledge = _NO_PRIOR_KNOWLEDGE
+
+    # --- Call flow (branched on inbound vs outbound) ---
+    if is_outbound:
+        call_flow = _OUTBOUND_CALL_FLOW.substitute(investor_name=name or "the investor")
+    else:
+        is_returning = bool(name and name not in ("", "Inbound Caller"))
+
+        if is_returning:
+            known_prefs = []
+            if capital:
+                known_prefs.append(f"capital: {capital}")
+            if timeline:
+                known_prefs.append(f"timeline: {timeline}")
+            if investment_preferences:
+                known_prefs.append(f"interests: {', '.join(investment_preferences)}")
+            if risk_tolerance:
+                known_prefs.append(f"risk tolerance: {risk_tolerance}")
+            prefs_summary = f" Known preferences — {'; '.join(known_prefs)}." if known_prefs else ""
+            caller_ref = (
+                f"You're speaking with a returning investor named {name}.{prefs_summary} "
+                f"Greet them by name. You already know who they are — do NOT ask for their name again."
+            )
+            if qualification_bucket in ("highly_qualified", "qualified"):
+                caller_ref += f" They are already marked as {qualification_bucket.replace('_', ' ')}. Focus on next steps rather than re-qualifying from scratch."
+            call_flow = _INBOUND_CALL_FLOW.substitute(
+                caller_ref=caller_ref,
+                first_message=_RETURNING_CALLER_FIRST_MESSAGE,
+                name_rule=_RETURNING_CALLER_NAME_RULE,
+            )
+        else:
+            call_flow = _INBOUND_CALL_FLOW.substitute(
+                caller_ref=_NEW_CALLER_REF,
+                first_message=_NEW_CALLER_FIRST_MESSAGE,
+                name_rule=_NEW_CALLER_NAME_RULE,
+            )
+
+    return f"{_STATIC_PREFIX}\n\n{call_flow}\n\n{prior_knowledge}"
+
+
+class BlackKeyXAdvisor(Agent):
+    """BlackKeyX AI Investment Advisor for investor qualification."""
+
+    @staticmethod
+    def _format_capital_for_voice(capital) -> str:
+        """Format capital value into natural speech for TTS."""
+        if not capital:
+            return ""
+
+        # String formats from chatbot (e.g. "$1M+" → "over 1 million dollars")
+        if isinstance(capital, str):
+            if capital in _CAPITAL_VOICE_MAP:
+                return _CAPITAL_VOICE_MAP[capital]
+            if capital.startswith("other:"):
+                return ""
+            return capital
+
+        # Integer values from DB (e.g. 1500000 → "1.5 million dollars")
+        if isinstance(capital, (int, float)):
+            if capital >= 1_000_000:
+                millions = capital / 1_000_000
+                if millions.is_integer():
+                    return f"{int(millions)} million dollars"
+                return f"{millions:.1f} million dollars"
+            if capital >= 1_000:
+                thousands = capital / 1_000
+                if thousands.is_integer():
+                    return f"{int(thousands)} thousand dollars"
+                return f"{thousands:.0f} thousand dollars"
+            return f"{capital} dollars"
+
+        return str(capital)
+
+    def __init__(self, investor_context: dict | None = None) -> None:
+        self.investor_context = investor_context or {}
+
+        # Extract context fields
+        is_outbound = self.investor_context.get("outbound", False)
+        name = self.investor_context.get("name", "")
+        capital = self._format_capital_for_voice(self.investor_context.get("capital_available"))
+        timeline = self.investor_context.get("timeline", "")
+
+        # Preferences are only rendered for returning inbound callers
+        is_returning = not is_outbound and bool(name and name not in ("", "Inbound Caller"))
+        investment_preferences = ()
+        if is_returning:
+            investment_preferences = self.investor_context.get("investment_preferences") or ()
+            if isinstance(investment_preferences, list):
+                investment_preferences = tuple(investment_preferences)
+
+        fields = (
+            is_outbound,
+            name,
+            capital,
+            timeline,
+            self.investor_context.get("qualification_bucket", ""),
+            investment_preferences,
+            self.investor_context.get("risk_tolerance", ""),
+        )
+        try:
+            instructions = _render_instructions(*fields)
+        except TypeError:
+            # Unhashable metadata value (e.g. a nested dict): render without the cache
+            instructions = _render_instructions.__wrapped__(*fields)
         super().__init__(instructions=instructions)
 
+        # Set by request_callback, read by the session-complete handler
+        self.callback_request: dict | None = None
+        self._room_deleted = False
+
+    async def _end_room(self) -> bool:
+        """Delete the call's room (ending the call) at most once per session.
+
+        Returns False when the delete failed, so the calling tool can report it
+        and a later tool call can retry.
+        """
+        job_ctx = get_job_context()
+        if not job_ctx or self._room_deleted:
+            return True
+        self._room_deleted = True
+        try:
+            await job_ctx.api.room.delete_room(api.DeleteRoomRequest(room=job_ctx.room.name))
+        except Exception:
+            self._room_deleted = False
+            logger.exception("failed to delete room", extra={"room": job_ctx.room.name})
+            return False
+        return True
+
     @function_tool()
     async def end_call(self, ctx: RunContext) -> str:
         """Called when the conversation is complete or the user wants to end the call."""
         # Generate a farewell message
         await ctx.session.generate_reply(
-            instructions="Thank the investor warmly for their time. Summarize the key preferences you learned (markets, property types, strategy). Let them know a Black Key Exchange team member will follow up within 24 hours with curated opportunities aligned with their mandate."
+            instructions=_END_CALL_INSTRUCTIONS
         )
 
         # Delete room to end the call
-        job_ctx = get_job_context()
-        if job_ctx:
-            await job_ctx.api.room.delete_room(
-                api.DeleteRoomRequest(room=job_ctx.room.name)
-            )
+        if not await self._end_room():
+            return "Failed to end the call"
 
         return "Call ended successfully"
 
@@ -345,7 +539,7 @@ Do not use bullet points or lists in your responses — speak conversationally."
         message_left = False
         if VOICEMAIL_LEAVE_MESSAGE:
             await ctx.session.generate_reply(
-                instructions="You've reached a voicemail. Leave a brief professional message: 'Hi, this is Alex from Black Key Exchange. We're assembling a private network of accredited investors around a narrow window in the current real estate cycle, and your profile stood out. When you have a moment, please give us a call back. Thank you.'"
+                instructions=_VOICEMAIL_MESSAGE_INSTRUCTIONS
             )
             message_left = True
 
@@ -357,10 +551,8 @@ Do not use bullet points or lists in your responses — speak conversationally."
         }
 
         # End the call
-        if job_ctx:
-            await job_ctx.api.room.delete_room(
-                api.DeleteRoomRequest(room=job_ctx.room.name)
-            )
+        if not await self._end_room():
+            return "Voicemail detected, but failed to end the call"
 
         return "Voicemail detected, call ended"
 
@@ -399,31 +591,38 @@ Do not use bullet points or lists in your responses — speak conversationally."
                               Ask the investor to confirm their timezone before calling this tool.
         """
         # Store callback info for session completion
-        job_ctx = get_job_context()
-        if job_ctx:
-            _callback_requests[job_ctx.room.name] = {
-                "callback_datetime": callback_datetime,
-                "callback_notes": callback_notes,
-                "investor_timezone": investor_timezone,
-            }
+        self.callback_request = {
+            "callback_datetime": callback_datetime,
+            "callback_notes": callback_notes,
+            "investor_timezone": investor_timezone,
+        }
 
         # Generate confirmation message
         await ctx.session.generate_reply(
-            instructions=f"""Confirm the callback time with the investor.
-They requested: {callback_datetime}.
-Thank them warmly for their time and let them know the Black Key Exchange team will
-reach out at their preferred time. Keep it brief and friendly."""
+            instructions=_CALLBACK_CONFIRMATION.substitute(callback_datetime=callback_datetime)
         )
 
         # End the call after confirmation
-        if job_ctx:
-            await job_ctx.api.room.delete_room(
-                api.DeleteRoomRequest(room=job_ctx.room.name)
-            )
+        if not await self._end_room():
+            return f"Callback scheduled for {callback_datetime}, but failed to end the call"
 
         return f"Callback scheduled for {callback_datetime}"
 
 
+# ParticipantKind values are plain protobuf ints, so this is an int compare
+_SIP_KIND = rtc.ParticipantKind.PARTICIPANT_KIND_SIP
+
+
+# Noise cancellation options are stateless, so one instance of each is shared by all calls
+_BVC = noise_cancellation.BVC()
+_NOISE_CANCELLATION_BY_KIND = {_SIP_KIND: noise_cancellation.BVCTelephony()}
+
+
+def select_noise_cancellation(params):
+    """Use telephony-optimized noise cancellation for SIP calls."""
+    return _NOISE_CANCELLATION_BY_KIND.get(params.participant.kind, _BVC)
+
+
 server = AgentServer()
 
 
@@ -432,11 +631,13 @@ async def blackkeyx_agent(ctx: agents.JobContext):
     """Main entrypoint for the BlackKeyX voice agent."""
 
     # Parse investor context from job metadata (passed from backend)
+    # Only a JSON object can carry investor context; anything else skips the parser entirely
     investor_context = {}
-    if ctx.job.metadata:
+    metadata = ctx.job.metadata
+    if metadata and metadata.lstrip().startswith("{"):
         try:
-            investor_context = json.loads(ctx.job.metadata)
-        except json.JSONDecodeError:
+            investor_context = orjson.loads(metadata)
+        except ValueError:  # orjson.JSONDecodeError subclasses ValueError
             pass
 
     is_outbound = investor_context.get("outbound", False)
@@ -447,30 +648,33 @@ async def blackkeyx_agent(ctx: agents.JobContext):
         if len(parts) >= 2 and parts[1].startswith("+"):
             caller_phone = parts[1]
             try:
-                body = json.dumps({"phone": caller_phone}).encode("utf-8")
-                signature = sign_payload(body, AGENT_CALLBACK_SECRET)
-                async with httpx.AsyncClient() as client:
-                    resp = await client.post(
-                        f"{BACKEND_URL}/api/v1/voice/inbound-context",
-                        content=body,
-                        headers={
-                            "Content-Type": "application/json",
-                            "X-Agent-Signature": signature,
-                        },
-                        timeout=5.0,
-                    )
+                body = orjson.dumps({"phone": caller_phone})
+                resp = await get_http_client().post(
+                    "/api/v1/voice/inbound-context",
+                    content=body,
+                    headers=signed_json_headers(body),
+                    timeout=5.0,
+                )
                 if resp.status_code == 200:
                     data = resp.json()
                     if data.get("found"):
                         investor_context.update(data)
-            except Exception as e:
-                print(f"Failed to fetch inbound investor context: {e}")
+            except Exception:
+                logger.exception(
+                    "failed to fetch inbound investor context", extra={"room": ctx.room.name}
+                )
 
     # Create session with STT-LLM-TTS pipeline via LiveKit Inference
     session = AgentSession(
         # stt="assemblyai/universal-streaming:en",
         # llm="openai/gpt-4.1-mini",
         # tts="cartesia/sonic-3:9626c31c-bec5-4cca-baa8-f8ba9e84c8bc",
+        # Re-enabling these needs `from livekit.plugins import silero` and the
+        # turn_detector MultilingualModel import at module scope: plugins register
+        # on the main thread at import, and download-files only fetches weights
+        # for plugins imported there. To load the VAD once per process rather than
+        # per session, set server.setup_fnc to a prewarm that stores
+        # silero.VAD.load() in proc.userdata and pass ctx.proc.userdata["vad"].
         # vad=silero.VAD.load(),
         # turn_detection=MultilingualModel(),
 
@@ -479,24 +683,32 @@ async def blackkeyx_agent(ctx: agents.JobContext):
         llm=ultravox.realtime.RealtimeModel()
     )
 
-    def build_transcript(items: list) -> str:
-        """Extract text transcript from chat history items."""
-        parts = []
-        for item in items:
-            if item.get("type") != "message":
-                continue
-            role = item.get("role", "unknown")
-            content_list = item.get("content", [])
-            text_parts = [c for c in content_list if isinstance(c, str)]
-            if text_parts:
-                parts.append(f"{role}: {' '.join(text_parts)}")
-        return "\n".join(parts)
+    advisor = BlackKeyXAdvisor(investor_context=investor_context)
+
+    # A SIP caller who hangs up has left the room by shutdown, so note it on join
+    sip_caller_seen = False
+
+    def note_sip_caller(participant: rtc.RemoteParticipant) -> None:
+        nonlocal sip_caller_seen
+        if participant.kind == _SIP_KIND:
+            sip_caller_seen = True
+
+    ctx.room.on("participant_connected", note_sip_caller)
 
     async def send_transcript():
         """Save transcript when session ends."""
         try:
             history = session.history.to_dict()
             items = history.get("items", [])
+            callback_info = advisor.callback_request
+
+            is_inbound = ctx.room.name.startswith("inbound-")
+            if not should_save_session(
+                items, callback_info is not None, is_outbound, is_inbound or sip_caller_seen
+            ):
+                logger.info("no conversation to save", extra={"room": ctx.room.name})
+                return
+
             transcript = build_transcript(items)
 
             payload = {
@@ -506,7 +718,7 @@ async def blackkeyx_agent(ctx: agents.JobContext):
             }
 
             # For inbound calls, extract caller phone from room name and name from tracker
-            if ctx.room.name.startswith("inbound-"):
+            if is_inbound:
                 # Parse phone from room name: inbound-_+1234567890_<random>
                 parts = ctx.room.name.split("_")
                 if len(parts) >= 2 and parts[1].startswith("+"):
@@ -514,7 +726,7 @@ async def blackkeyx_agent(ctx: agents.JobContext):
                 else:
                     # Fallback: SIP participant attributes
                     for participant in ctx.room.remote_participants.values():
-                        if participant.kind == rtc.ParticipantKind.PARTICIPANT_KIND_SIP:
+                        if participant.kind == _SIP_KIND:
                             payload["caller_phone"] = (
                                 participant.attributes.get("sip.phoneNumber")
                                 or participant.attributes.get("sip.callFrom")
@@ -534,53 +746,58 @@ async def blackkeyx_agent(ctx: agents.JobContext):
                 payload["voicemail_message_left"] = voicemail_info["voicemail_message_left"]
 
             # Add callback info if present
-            callback_info = _callback_requests.pop(ctx.room.name, None)
             if callback_info:
                 payload["callback_requested"] = True
                 payload["callback_datetime"] = callback_info["callback_datetime"]
                 payload["callback_notes"] = callback_info.get("callback_notes", "")
                 payload["investor_timezone"] = callback_info.get("investor_timezone", "")
 
-            body_bytes = json.dumps(payload).encode("utf-8")
-            signature = sign_payload(body_bytes, AGENT_CALLBACK_SECRET)
-
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{BACKEND_URL}/api/v1/voice/session-complete",
-                    content=body_bytes,
-                    headers={
-                        "Content-Type": "application/json",
-                        "X-Agent-Signature": signature,
+            body_bytes = orjson.dumps(payload)
+            headers = signed_json_headers(body_bytes)
+            if TRANSCRIPT_GZIP:
+                # The signature covers the JSON; the backend verifies it after decompressing
+                body_bytes = gzip.compress(body_bytes, compresslevel=1)
+                headers["Content-Encoding"] = "gzip"
+
+            response = await get_http_client().post(
+                "/api/v1/voice/session-complete",
+                content=body_bytes,
+                headers=headers,
+            )
+            if response.status_code == 200:
+                logger.info("transcript saved", extra={"room": ctx.room.name})
+            else:
+                logger.error(
+                    "failed to save transcript",
+                    extra={
+                        "room": ctx.room.name,
+                        "status_code": response.status_code,
+                        "response_body": response.text,
                     },
-                    timeout=10.0,
                 )
-                if response.status_code == 200:
-                    print(f"Transcript saved for room: {ctx.room.name}")
-                else:
-                    print(f"Failed to save transcript: {response.status_code}")
-                    print(f"Response body: {response.text}")
-        except Exception as e:
-            print(f"Error saving transcript: {e}")
+        except Exception:
+            logger.exception("error saving transcript", extra={"room": ctx.room.name})
 
+    # Awaited rather than spawned as a background task: shutdown callbacks run after the
+    # room is gone, so the caller never waits on this POST, and the job process exits once
+    # they return, which would drop a detached upload.
     ctx.add_shutdown_callback(send_transcript)
 
     await session.start(
         room=ctx.room,
-        agent=BlackKeyXAdvisor(investor_context=investor_context),
+        agent=advisor,
         room_options=room_io.RoomOptions(
             audio_input=room_io.AudioInputOptions(
-                # Use telephony-optimized noise cancellation for SIP calls
-                noise_cancellation=lambda params: (
-                    noise_cancellation.BVCTelephony()
-                    if params.participant.kind
-                    == rtc.ParticipantKind.PARTICIPANT_KIND_SIP
-                    else noise_cancellation.BVC()
-                ),
+                noise_cancellation=select_noise_cancellation,
             ),
         ),
     )
 
     # Get investor name for personalization
+    # Participants already in the room when the session connected
+    for participant in ctx.room.remote_participants.values():
+        note_sip_caller(participant)
+
     investor_name = investor_context.get("name", "there")
 
     is_returning = bool(
@@ -592,21 +809,17 @@ async def blackkeyx_agent(ctx: agents.JobContext):
     if is_outbound:
         # For outbound calls: introduce and confirm identity first (timing question comes after confirmation)
         await session.generate_reply(
-            instructions=f"""Say "Hi, this is Alex calling from Black Key Exchange. Am I speaking with {investor_name}?"
-Do NOT greet them by name before introducing yourself — you don't know who picked up yet.
-Wait for their confirmation before asking anything else.
-Do NOT ask about timing yet - wait for them to confirm they are {investor_name} first."""
+            instructions=_OUTBOUND_GREETING.substitute(investor_name=investor_name)
         )
     elif is_returning:
         # For returning inbound callers: greet by name
         await session.generate_reply(
-            instructions=f"Greet {investor_name} warmly by name. Introduce yourself as Alex from Black Key Exchange. Welcome them back and ask how you can help them today."
+            instructions=_RETURNING_GREETING.substitute(investor_name=investor_name)
         )
     else:
         # For first-time inbound callers: introduce yourself and ask for their name
         await session.generate_reply(
-            instructions="""You MUST say something like: "Welcome to Black Key Exchange! This is Alex. May I know who I have the pleasure of speaking with today?"
-You MUST ask for the caller's name in this first message. Do NOT ask about their investment goals or how you can help yet — just introduce yourself and ask their name. Nothing else."""
+            instructions=_NEW_CALLER_GREETING
         )
 
 
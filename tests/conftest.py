@@ -1,4 +1,8 @@
-"""Shared fixtures for BlackKeyX voice agent tests."""
+"""Shared fixtures for BlackKeyX voice agent tests.
+
+Tests are independent and network-bound on the LLM; run them in parallel
+with ``pytest -n auto`` (pytest-xdist). Each worker gets its own session LLM.
+"""
 
 import sys
 from pathlib import Path
@@ -13,6 +17,7 @@ if _agent_dir not in sys.path:
 
 import pytest
 import pytest_asyncio
+from pytest_asyncio import is_async_test
 
 from livekit.agents import AgentSession, mock_tools
 from livekit.plugins import openai
@@ -43,6 +48,14 @@ SAMPLE_OUTBOUND_CONTEXT = {
 # ---------------------------------------------------------------------------
 
 
+def pytest_collection_modifyitems(items):
+    """Run async tests on the session event loop so they can share the session-scoped LLM."""
+    session_loop = pytest.mark.asyncio(loop_scope="session")
+    for item in items:
+        if is_async_test(item):
+            item.add_marker(session_loop, append=False)
+
+
 @pytest.fixture
 def inbound_context():
     return SAMPLE_INBOUND_CONTEXT.copy()
@@ -53,9 +66,9 @@ def outbound_context():
     return SAMPLE_OUTBOUND_CONTEXT.copy()
 
 
-@pytest_asyncio.fixture
+@pytest_asyncio.fixture(scope="session", loop_scope="session")
 async def llm():
-    """OpenAI text LLM for agent session and judge evaluations."""
+    """OpenAI text LLM for agent session and judge evaluations, shared by all tests."""
     async with openai.LLM(model="gpt-4o-mini") as llm_instance:
         yield llm_instance
 
@@ -0,0 +1,65 @@
+"""Unit tests for BlackKeyXAdvisor room teardown shared by the call-ending tools."""
+
+import logging
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import agent
+from agent import BlackKeyXAdvisor
+
+
+def _fake_job_ctx(delete_room: AsyncMock) -> SimpleNamespace:
+    return SimpleNamespace(
+        room=SimpleNamespace(name="outbound-test-room"),
+        api=SimpleNamespace(room=SimpleNamespace(delete_room=delete_room)),
+    )
+
+
+def _fake_run_ctx() -> SimpleNamespace:
+    return SimpleNamespace(session=SimpleNamespace(generate_reply=AsyncMock()))
+
+
+class TestEndRoom:
+    """The room is deleted at most once; a failed delete is reported and can be retried."""
+
+    async def test_tools_called_twice_delete_once(self, monkeypatch):
+        delete_room = AsyncMock()
+        monkeypatch.setattr(agent, "get_job_context", lambda: _fake_job_ctx(delete_room))
+        advisor = BlackKeyXAdvisor({"outbound": True, "name": "Jane"})
+
+        await advisor.end_call(_fake_run_ctx())
+        await advisor.end_call(_fake_run_ctx())
+        await advisor.request_callback(_fake_run_ctx(), "tomorrow at 3pm")
+
+        assert delete_room.await_count == 1
+
+    async def test_failed_delete_is_logged_and_reported(self, monkeypatch, caplog):
+        delete_room = AsyncMock(side_effect=RuntimeError("room service unavailable"))
+        monkeypatch.setattr(agent, "get_job_context", lambda: _fake_job_ctx(delete_room))
+        advisor = BlackKeyXAdvisor({"outbound": True, "name": "Jane"})
+
+        with caplog.at_level(logging.ERROR, logger="blackkeyx"):
+            result = await advisor.end_call(_fake_run_ctx())
+
+        assert result == "Failed to end the call"
+        assert delete_room.await_count == 1
+        assert "failed to delete room" in caplog.text
+
+    async def test_end_call_retries_after_failed_delete(self, monkeypatch):
+        delete_room = AsyncMock(side_effect=[RuntimeError("room service unavailable"), None])
+        monkeypatch.setattr(agent, "get_job_context", lambda: _fake_job_ctx(delete_room))
+        advisor = BlackKeyXAdvisor({"outbound": True, "name": "Jane"})
+
+        assert await advisor.end_call(_fake_run_ctx()) == "Failed to end the call"
+        assert await advisor.end_call(_fake_run_ctx()) == "Call ended successfully"
+        assert delete_room.await_count == 2
+
+    async def test_no_job_context(self, monkeypatch):
+        monkeypatch.setattr(agent, "get_job_context", lambda: None)
+        advisor = BlackKeyXAdvisor({"outbound": True, "name": "Jane"})
+
+        assert await advisor.end_call(_fake_run_ctx()) == "Call ended successfully"
@@ -0,0 +1,88 @@
+"""Unit tests for BlackKeyXAdvisor instruction rendering."""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from agent import _STATIC_PREFIX, BlackKeyXAdvisor, _render_instructions
+
+
+class TestRenderInstructions:
+    """Each call type renders the static prefix followed by its own context."""
+
+    def test_outbound(self):
+        instructions = BlackKeyXAdvisor(
+            {
+                "outbound": True,
+                "name": "Jane Doe",
+                "capital_available": "$500K-$1M",
+                "timeline": "3-6 months",
+            }
+        ).instructions
+        assert instructions.startswith(_STATIC_PREFIX)
+        assert "CALL TYPE: OUTBOUND" in instructions
+        assert "Am I speaking with Jane Doe?" in instructions
+        assert "- Capital available: 500 thousand to 1 million dollars" in instructions
+        assert "- Investment timeline: 3-6 months" in instructions
+
+    def test_new_inbound(self):
+        instructions = BlackKeyXAdvisor({"name": "Inbound Caller"}).instructions
+        assert instructions.startswith(_STATIC_PREFIX)
+        assert "CALL TYPE: INBOUND" in instructions
+        assert "The caller is a new inbound lead" in instructions
+        assert "returning investor" not in instructions
+        assert "Capital available" not in instructions
+
+    def test_returning_inbound(self):
+        instructions = BlackKeyXAdvisor(
+            {
+                "name": "Jane Doe",
+                "capital_available": 2_500_000,
+                "timeline": "ASAP",
+                "investment_preferences": ["industrial", "multifamily"],
+                "risk_tolerance": "moderate",
+                "qualification_bucket": "qualified",
+            }
+        ).instructions
+        assert instructions.startswith(_STATIC_PREFIX)
+        assert "CALL TYPE: INBOUND" in instructions
+        assert "returning investor named Jane Doe" in instructions
+        assert (
+            "Known preferences — capital: 2.5 million dollars; timeline: ASAP; "
+            "interests: industrial, multifamily; risk tolerance: moderate."
+        ) in instructions
+        assert "already marked as qualified" in instructions
+        assert "- Capital available: 2.5 million dollars" in instructions
+        assert "- Investment timeline: ASAP" in instructions
+
+    def test_repeated_context_is_cached(self):
+        args = (False, "Jane Doe", "", "ASAP", "", ("industrial",), "")
+        assert _render_instructions(*args) is _render_instructions(*args)
+
+
+class TestUnhashableContext:
+    """Metadata values the render cache cannot key on still produce instructions."""
+
+    def test_dict_risk_tolerance_on_returning_caller(self):
+        advisor = BlackKeyXAdvisor({"name": "Jane", "risk_tolerance": {"level": "moderate"}})
+        assert "returning investor named Jane" in advisor.instructions
+        assert "risk tolerance: {'level': 'moderate'}" in advisor.instructions
+
+    def test_list_timeline_on_outbound(self):
+        advisor = BlackKeyXAdvisor({"outbound": True, "timeline": ["Q1"]})
+        assert "- Investment timeline: ['Q1']" in advisor.instructions
+
+    def test_outbound_ignores_preferences(self):
+        advisor = BlackKeyXAdvisor(
+            {"outbound": True, "investment_preferences": [{"type": "multifamily"}]}
+        )
+        assert "CALL TYPE: OUTBOUND" in advisor.instructions
+        assert "{'type': 'multifamily'}" not in advisor.instructions
+
+    def test_matches_cached_render(self):
+        context = {"name": "Jane", "timeline": "Q1"}
+        cached = BlackKeyXAdvisor(context).instructions
+        uncached = BlackKeyXAdvisor({**context, "risk_tolerance": {}}).instructions
+        # An empty dict is falsy, so it renders exactly like no risk tolerance
+        assert uncached == cached
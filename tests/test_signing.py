@@ -0,0 +1,71 @@
+"""Unit tests for sign_payload() — backend callback signatures."""
+
+import base64
+import hashlib
+import hmac
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import agent
+from agent import AGENT_CALLBACK_SECRET, sign_payload, sign_payload_v2, signed_json_headers
+
+
+def _reference_signature(body: bytes, secret: str) -> str:
+    key = hashlib.sha256(secret.encode()).digest()
+    return hmac.new(key, body, hashlib.sha256).hexdigest()
+
+
+class TestSignPayload:
+    """Signatures must stay byte-compatible with the backend's verifier."""
+
+    def test_matches_reference_with_configured_secret(self):
+        body = b'{"room_name": "inbound-_+15551234567_abc"}'
+        assert sign_payload(body, AGENT_CALLBACK_SECRET) == _reference_signature(
+            body, AGENT_CALLBACK_SECRET
+        )
+
+    def test_matches_reference_with_other_secret(self):
+        body = b'{"phone": "+15551234567"}'
+        assert sign_payload(body, "another-secret") == _reference_signature(
+            body, "another-secret"
+        )
+
+    def test_empty_body(self):
+        assert sign_payload(b"", AGENT_CALLBACK_SECRET) == _reference_signature(
+            b"", AGENT_CALLBACK_SECRET
+        )
+
+    def test_different_secrets_differ(self):
+        body = b"{}"
+        assert sign_payload(body, "a") != sign_payload(body, "b")
+
+
+class TestSignPayloadV2:
+    """V2 carries the same HMAC, base64-encoded instead of hex."""
+
+    def test_same_digest_as_v1(self):
+        body = b'{"room_name": "outbound-abc"}'
+        raw = base64.b64decode(sign_payload_v2(body, AGENT_CALLBACK_SECRET))
+        assert raw.hex() == sign_payload(body, AGENT_CALLBACK_SECRET)
+
+    def test_length(self):
+        assert len(sign_payload_v2(b"{}", AGENT_CALLBACK_SECRET)) == 44
+
+
+class TestSignedJsonHeaders:
+    """Header name follows the AGENT_SIGNATURE_V2 flag."""
+
+    def test_v1_when_disabled(self, monkeypatch):
+        monkeypatch.setattr(agent, "AGENT_SIGNATURE_V2", False)
+        headers = signed_json_headers(b"{}")
+        assert headers["Content-Type"] == "application/json"
+        assert headers["X-Agent-Signature"] == sign_payload(b"{}", AGENT_CALLBACK_SECRET)
+        assert "X-Agent-Signature-V2" not in headers
+
+    def test_v2_when_enabled(self, monkeypatch):
+        monkeypatch.setattr(agent, "AGENT_SIGNATURE_V2", True)
+        headers = signed_json_headers(b"{}")
+        assert headers["X-Agent-Signature-V2"] == sign_payload_v2(b"{}", AGENT_CALLBACK_SECRET)
+        assert "X-Agent-Signature" not in headers
@@ -0,0 +1,69 @@
+"""Unit tests for build_transcript() and should_save_session() — session-complete payload."""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from agent import build_transcript, should_save_session
+
+
+class TestBuildTranscript:
+    """Only text content of message items ends up in the transcript."""
+
+    def test_messages_in_order(self):
+        items = [
+            {"type": "message", "role": "assistant", "content": ["Hi, this is Alex."]},
+            {"type": "message", "role": "user", "content": ["Hello Alex."]},
+        ]
+        assert build_transcript(items) == "assistant: Hi, this is Alex.\nuser: Hello Alex."
+
+    def test_joins_multiple_text_parts(self):
+        items = [{"type": "message", "role": "user", "content": ["Dallas", "and Austin"]}]
+        assert build_transcript(items) == "user: Dallas and Austin"
+
+    def test_skips_non_message_items(self):
+        items = [
+            {"type": "function_call", "name": "end_call"},
+            {"type": "message", "role": "assistant", "content": ["Goodbye."]},
+            {"type": "function_call_output", "output": "Call ended successfully"},
+        ]
+        assert build_transcript(items) == "assistant: Goodbye."
+
+    def test_skips_non_text_content(self):
+        items = [
+            {"type": "message", "role": "user", "content": [{"type": "audio_content"}]},
+            {"type": "message", "role": "user", "content": [{"type": "image"}, "Yes."]},
+        ]
+        assert build_transcript(items) == "user: Yes."
+
+    def test_missing_role_and_content(self):
+        items = [
+            {"type": "message", "content": ["Hello?"]},
+            {"type": "message", "role": "user"},
+        ]
+        assert build_transcript(items) == "unknown: Hello?"
+
+    def test_empty_history(self):
+        assert build_transcript([]) == ""
+
+
+class TestShouldSaveSession:
+    """Empty sessions are skipped only when the backend has no use for them."""
+
+    def test_empty_web_session_skipped(self):
+        assert should_save_session([], False, False, False) is False
+
+    def test_history_saved(self):
+        items = [{"type": "message", "role": "user", "content": ["Hi"]}]
+        assert should_save_session(items, False, False, False) is True
+
+    def test_callback_saved(self):
+        assert should_save_session([], True, False, False) is True
+
+    def test_empty_outbound_saved(self):
+        assert should_save_session([], False, True, False) is True
+
+    def test_empty_phone_call_saved(self):
+        # e.g. an investor-call- room from the SIP dispatch rule, caller hung up early
+        assert should_save_session([], False, False, True) is True